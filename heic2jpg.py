@@ -1,8 +1,9 @@
 import sys
 import os
+import math
 from io import BytesIO
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from threading import Lock
 from PIL import Image
 
@@ -14,6 +15,29 @@ except Exception as e:
     print("HEIC support not available. Ensure pillow-heif is installed. Error:", e)
     sys.exit(1)
 
+# Optional: libjpeg-turbo encoder (much faster than Pillow's bundled libjpeg)
+try:
+    import numpy as np
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJFLAG_PROGRESSIVE
+    _tj = TurboJPEG()
+except Exception:
+    _tj = None
+
+# Optional: OpenCV's SIMD area resampling for downscaling
+try:
+    import numpy as np
+    import cv2
+except Exception:
+    cv2 = None
+
+# Optional: libvips, to decode + shrink HEICs in one streamed pipeline
+try:
+    import pyvips
+    if not pyvips.type_find("VipsForeign", "heifload"):
+        pyvips = None  # libvips built without libheif
+except Exception:
+    pyvips = None
+
 # --------- Config (hardcoded) ---------
 TARGET_MB = 0.5
 MAX_SIDE = 2000
@@ -23,36 +47,98 @@ OPTIMIZE = True
 # worker count = CPU cores - 2
 CPU_COUNT = os.cpu_count() or 4
 WORKERS = max(1, CPU_COUNT - 2)
+# parallel quality probes need at least this many threads to pay off, so they
+# only run for batches of at most WORKERS // MIN_PROBE_THREADS files
+MIN_PROBE_THREADS = 4
 
-# ---------- Thread-safe printing & progress ----------
+# ---------- Printing & progress (main process only) ----------
 _print_lock = Lock()
 def tprint(*args, **kwargs):
     with _print_lock:
         print(*args, **kwargs)
 
-def render_progress(completed: int, total: int, width: int = 30):
-    pct = 0 if total == 0 else int((completed / total) * 100)
-    filled = int(width * pct / 100)
-    bar = "#" * filled + "-" * (width - filled)
-    with _print_lock:
-        print(f"[{bar}] {pct:3d}%  ({completed}/{total})", end="\r", flush=True)
+PROGRESS_WIDTH = 30
+def _make_bar(pct: int) -> str:
+    filled = PROGRESS_WIDTH * pct // 100
+    return "#" * filled + "-" * (PROGRESS_WIDTH - filled)
+
+_BARS = [_make_bar(pct) for pct in range(101)]  # one prebuilt bar per percent
+
+def render_progress(completed: int, total: int):
+    # Only the main process renders progress, so no lock is needed.
+    pct = 0 if total == 0 else completed * 100 // total
+    sys.stdout.write(f"[{_BARS[pct]}] {pct:3d}%  ({completed}/{total})\r")
+    sys.stdout.flush()
 
 # ---------- Image utils ----------
-def safe_out_path(out_dir: Path, base_name: str) -> Path:
-    """Create a unique output path that never overwrites an existing file."""
-    p = out_dir / f"{base_name}.jpg"
-    if not p.exists():
-        return p
-    i = 1
+def safe_out_path(out_dir: Path, base_name: str) -> tuple[int, Path]:
+    """Atomically create a unique output file that never overwrites an existing one.
+
+    Returns the open (write-only) fd and its path. O_EXCL makes the check and
+    the create one step, so parallel workers can't claim the same name.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    i = 0
     while True:
-        candidate = out_dir / f"{base_name}_{i}.jpg"
-        if not candidate.exists():
-            return candidate
-        i += 1
+        candidate = out_dir / (f"{base_name}.jpg" if i == 0 else f"{base_name}_{i}.jpg")
+        try:
+            return os.open(candidate, flags, 0o644), candidate
+        except FileExistsError:
+            i += 1
+
+def splice_exif(jpeg: bytes, exif_bytes: bytes) -> bytes:
+    """Insert an APP1 (EXIF) segment after SOI, or after the JFIF APP0 if present."""
+    if not exif_bytes.startswith(b"Exif\x00\x00"):
+        exif_bytes = b"Exif\x00\x00" + exif_bytes
+    seg_len = len(exif_bytes) + 2
+    if seg_len > 0xFFFF:
+        raise ValueError("EXIF data is too long")
+    # JFIF requires APP0 to come first; turbojpeg writes one.
+    pos = 2
+    if jpeg[2:4] == b"\xff\xe0":
+        pos += 2 + int.from_bytes(jpeg[4:6], "big")
+    return jpeg[:pos] + b"\xff\xe1" + seg_len.to_bytes(2, "big") + exif_bytes + jpeg[pos:]
+
+def pixel_source(im: Image.Image) -> "Image.Image | np.ndarray":
+    """RGB pixels in the form the active encoder consumes, built once per image."""
+    # convert() copies even when the mode already matches; 8-bit HEIC is usually RGB.
+    im_rgb = im if im.mode == "RGB" else im.convert("RGB")
+    return np.asarray(im_rgb) if _tj is not None else im_rgb
 
-def encode_to_bytes(im: Image.Image, quality: int,
+def write_jpeg(fd: int, data: bytes) -> None:
+    """Write data to an open fd, preallocating it where the OS supports that
+    (Linux). Afterwards, hint that its cached pages won't be read again: this
+    starts writeback, and the kernel drops the pages once they are clean."""
+    n = len(data)
+    if n and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, n)
+        except OSError:
+            pass  # filesystem without fallocate support
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, n, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass  # only a hint; the data is already written
+
+def encode_to_bytes(im: "Image.Image | np.ndarray", quality: int,
                     subsampling: int, progressive: bool, optimize: bool,
                     exif_bytes: bytes | None) -> bytes:
+    if _tj is not None:
+        # Pillow subsampling 0/1/2 lines up with TJSAMP_444/422/420.
+        # Progressive mode in libjpeg-turbo already uses optimized Huffman tables.
+        data = _tj.encode(
+            im if isinstance(im, np.ndarray) else np.asarray(im),
+            quality=int(quality),
+            pixel_format=TJPF_RGB,
+            jpeg_subsample=subsampling,
+            flags=TJFLAG_PROGRESSIVE if progressive else 0,
+        )
+        return splice_exif(data, exif_bytes) if exif_bytes else data
+
     buf = BytesIO()
     save_kwargs = dict(
         format="JPEG",
@@ -64,6 +150,8 @@ def encode_to_bytes(im: Image.Image, quality: int,
     if exif_bytes:
         save_kwargs["exif"] = exif_bytes
     im.save(buf, **save_kwargs)
+    # getvalue() hands back BytesIO's own buffer (trimmed in place) rather than
+    # copying it; bytes(buf.getbuffer()) or a bytearray would add a copy.
     return buf.getvalue()
 
 def downscale_to_max_side(im: Image.Image, max_side: int) -> Image.Image:
@@ -73,67 +161,355 @@ def downscale_to_max_side(im: Image.Image, max_side: int) -> Image.Image:
         return im
     scale = max_side / float(m)
     new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if cv2 is not None and im.mode in ("L", "RGB", "RGBA"):
+        out = Image.fromarray(cv2.resize(np.asarray(im), new_size, interpolation=cv2.INTER_AREA))
+        out.info.update(im.info)
+        return out
     return im.resize(new_size, Image.LANCZOS)
 
+def draft_to_max_side(im: Image.Image, max_side: int) -> None:
+    """Let the decoder hand back a smaller image (e.g. an embedded HEIC thumbnail)
+    that still covers max_side, so fewer pixels are decoded. No-op if unsupported."""
+    w, h = im.size
+    m = max(w, h)
+    if m <= max_side:
+        return
+    scale = max_side / float(m)
+    im.draft("RGB", (max(1, int(w * scale)), max(1, int(h * scale))))
+
 # ---------- Fast targetting ----------
+def quality_scale(q: float) -> float:
+    """libjpeg's quality -> quantization table scale (percent)."""
+    q = min(max(q, 1.0), 100.0)
+    return 5000.0 / q if q < 50 else 200.0 - 2.0 * q
+
+def scale_to_quality(scale: float) -> float:
+    """Inverse of quality_scale()."""
+    return 5000.0 / scale if scale > 100.0 else (200.0 - scale) / 2.0
+
+def predict_quality(q: int, size: int, target_bytes: int, exponent: float = 1.0) -> int:
+    """Guess the quality that lands on target_bytes from one measured encode.
+
+    Output size is roughly proportional to scale ** -exponent (about 1 by
+    default), so scale the probe's table by (size/target) ** (1/exponent) and
+    map it back to a quality.
+    """
+    scale = quality_scale(q) * (size / max(1, target_bytes)) ** (1.0 / exponent)
+    return int(scale_to_quality(scale))
+
+def fit_exponent(q1: int, size1: int, q2: int, size2: int) -> float:
+    """Size-vs-scale exponent for predict_quality() from two measured encodes."""
+    s1, s2 = quality_scale(q1), quality_scale(q2)
+    if s1 == s2 or size1 <= 0 or size2 <= 0:
+        return 1.0
+    return min(max(math.log(size1 / size2) / math.log(s2 / s1), 0.3), 3.0)
+
+# Last quality that fit, per resolution bucket (per process). Batches from one
+# camera tend to land on similar qualities, so later files start close.
+_quality_cache: dict[tuple[int, int], int] = {}
+# Final/probe size ratio seen for the bucket's last file (see jpeg_under_size).
+_probe_ratio: dict[tuple[int, int], float] = {}
+
+def resolution_bucket(size: tuple[int, int]) -> tuple[int, int]:
+    w, h = size
+    return max(w, h) // 256, min(w, h) // 256
+
+def model_probe_search(
+    pixels: "Image.Image | np.ndarray",
+    probe_target: int,
+    exif_bytes: bytes | None,
+    subsampling: int,
+    q_lo: int,
+    q_hi: int,
+    q_start: int,
+    max_iters: int,
+    model_iters: int,
+) -> tuple[bytes | None, int]:
+    """Sequential probe search: size-model jumps, then bisection if needed."""
+    best, best_q = None, -1
+    lo, hi = q_lo, q_hi
+    q = min(max(q_start, lo), hi)
+    prev = None
+    exponent = 1.0
+    for i in range(model_iters):
+        data = encode_to_bytes(pixels, q, subsampling, False, False, exif_bytes)
+        if prev is not None:
+            # Two measurements: fit the exponent to this image instead of assuming 1.
+            exponent = fit_exponent(prev[0], prev[1], q, len(data))
+        prev = (q, len(data))
+        if len(data) <= probe_target:
+            if q > best_q:
+                best, best_q = data, q
+            lo = q + 1
+            if i > 0 or q >= q_hi or len(data) >= probe_target * 0.9:
+                break
+        else:
+            hi = q - 1
+        if lo > hi:
+            break
+        q = min(max(predict_quality(q, len(data), probe_target, exponent), lo), hi)
+    if best is None:
+        for _ in range(max_iters):
+            if lo > hi:
+                break
+            mid = (lo + hi) // 2
+            data = encode_to_bytes(pixels, mid, subsampling, False, False, exif_bytes)
+            if len(data) <= probe_target:
+                best, best_q = data, mid
+                lo = mid + 1
+            else:
+                hi = mid - 1
+    return best, best_q
+
+def parallel_probe_search(
+    pixels: "Image.Image | np.ndarray",
+    target_bytes: int,
+    exif_bytes: bytes | None,
+    subsampling: int,
+    q_lo: int,
+    q_hi: int,
+    threads: int,
+    progressive: bool,
+    optimize: bool,
+) -> tuple[bytes | None, int]:
+    """Probe q_hi once; on a miss, encode `threads` qualities at once in a
+    window centred on the size model's prediction, narrowing to the gap
+    between the best fit and the first miss until it closes.
+
+    Probes already use the final progressive/optimize settings: a round costs
+    one encode of wall-clock time, so a separate final encode would only add
+    latency.
+
+    Both encoders release the GIL while encoding, so threads run probes in parallel.
+    Image.save() keeps per-call state on the image, so each Pillow probe in a
+    round gets its own copy; numpy buffers are shared as-is.
+    """
+    data = encode_to_bytes(pixels, q_hi, subsampling, progressive, optimize, exif_bytes)
+    if len(data) <= target_bytes:
+        return data, q_hi
+
+    if isinstance(pixels, Image.Image):
+        sources = [pixels] + [pixels.copy() for _ in range(threads - 1)]
+    else:
+        sources = [pixels] * threads
+
+    best, best_q = None, -1
+    lo, hi = q_lo, q_hi - 1
+    centre = predict_quality(q_hi, len(data), target_bytes)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while lo <= hi:
+            if hi - lo + 1 <= threads:
+                qs = list(range(lo, hi + 1))
+            else:
+                start = min(max(centre - threads // 2, lo), hi - threads + 1)
+                qs = list(range(start, start + threads))
+            results = list(pool.map(
+                lambda src, q: encode_to_bytes(src, q, subsampling, progressive, optimize, exif_bytes),
+                sources, qs))
+            for q, data in zip(qs, results):
+                if len(data) <= target_bytes:
+                    best, best_q = data, q
+                    lo = q + 1
+                else:
+                    hi = q - 1
+                    break
+            # Re-aim at the edge the round ended on.
+            edge_q, edge = (qs[0], results[0]) if best_q < qs[0] else (best_q, best)
+            centre = predict_quality(edge_q, len(edge), target_bytes)
+    return best, best_q
+
 def jpeg_under_size(
-    im: Image.Image,
+    pixels: "Image.Image | np.ndarray",
     target_bytes: int,
-    keep_exif: bool,
+    exif_bytes: bytes | None,
     subsampling: int,
     progressive: bool,
     optimize: bool,
     q_lo: int = 40,
     q_hi: int = 90,
     max_iters: int = 7,
+    model_iters: int = 3,
+    cache_key: tuple[int, int] | None = None,
+    probe_threads: int = 1,
 ) -> bytes | None:
-    """Binary search on JPEG quality to fit <= target_bytes."""
-    exif_bytes = im.info.get("exif", None) if keep_exif else None
-    im_rgb = im.convert("RGB")
+    """Find a JPEG quality that fits <= target_bytes.
 
-    best = None
-    lo, hi = q_lo, q_hi
-    for _ in range(max_iters):
-        mid = (lo + hi) // 2
-        data = encode_to_bytes(im_rgb, mid, subsampling, progressive, optimize, exif_bytes)
-        if len(data) <= target_bytes:
-            best = data
-            lo = mid + 1
+    The first probe is the last quality that fit for cache_key, or q_hi. A fit
+    at q_hi, or within 10% of the target, is returned right away; otherwise
+    jump to the quality predicted by the size model, usually fitting in two
+    encodes. If the model has not produced a fit after model_iters encodes,
+    binary search the remaining window. With a cold cache and at least
+    MIN_PROBE_THREADS probe_threads, probes run as parallel rounds of final
+    encodes instead (see parallel_probe_search).
+
+    Sequential probes are plain baseline encodes (no progressive scans, no Huffman
+    optimization); only the winner is re-encoded with the requested settings.
+    That final file is smaller than its probe, so the probe target is widened
+    by the final/probe ratio learned from the previous file in the bucket
+    (clamped to [0.8, 1]); the final quality is then settled by bisection.
+    `pixels` comes from pixel_source() so every probe reuses the same buffer.
+
+    If nothing fits, the final encode at q_lo is returned when one was made
+    (so the caller need not repeat it), otherwise None.
+    """
+    # turbojpeg has no optimize switch; libjpeg optimizes progressive scans anyway
+    needs_final = progressive or (optimize and _tj is None)
+    probe_target = int(target_bytes / _probe_ratio.get(cache_key, 1.0)) if needs_final else target_bytes
+
+    # Parallel rounds only beat the size model when there is no cached quality
+    # to start from, and only with enough threads to cut the window quickly.
+    if probe_threads >= MIN_PROBE_THREADS and cache_key not in _quality_cache:
+        best, best_q = parallel_probe_search(pixels, target_bytes, exif_bytes, subsampling,
+                                             q_lo, q_hi, probe_threads, progressive, optimize)
+        needs_final = False
+    else:
+        best, best_q = model_probe_search(pixels, probe_target, exif_bytes, subsampling,
+                                          q_lo, q_hi, _quality_cache.get(cache_key, q_hi),
+                                          max_iters, model_iters)
+
+    floor = None  # final-settings encode at q_lo, if one gets made
+    if needs_final:
+        if best is None:
+            # No baseline probe fit, but the (smaller) final encode still may.
+            best_q = q_lo
+            best = encode_to_bytes(pixels, best_q, subsampling, progressive, optimize, exif_bytes)
         else:
-            hi = mid - 1
-        if lo > hi:
-            break
+            probe_len = len(best)
+            best = encode_to_bytes(pixels, best_q, subsampling, progressive, optimize, exif_bytes)
+            if cache_key is not None:
+                # The ratio depends on content too; clamp it so one smooth file
+                # can't send the next noisy one in the bucket far over target.
+                _probe_ratio[cache_key] = min(max(len(best) / probe_len, 0.8), 1.0)
+        if best_q == q_lo:
+            floor = best
+
+        # Settle the final encode by bisecting between the last quality known to
+        # fit and the first miss, letting the size model pick the first step.
+        # A fit is pushed up at most twice (cold bucket: the final can land far
+        # under target); a miss keeps going down until something fits.
+        fit, fit_q = (best, best_q) if len(best) <= target_bytes else (None, -1)
+        lo, hi = (best_q + 1, q_hi) if fit is not None else (q_lo, best_q - 1)
+        q, size, steps = best_q, len(best), 0
+        while lo <= hi:
+            if fit is not None and (steps >= 2 or len(fit) >= target_bytes * 0.9):
+                break
+            if steps == 0:
+                q = min(max(predict_quality(q, size, int(target_bytes * 0.95)), lo), hi)
+            else:
+                q = (lo + hi) // 2
+            data = encode_to_bytes(pixels, q, subsampling, progressive, optimize, exif_bytes)
+            size, steps = len(data), steps + 1
+            if q == q_lo:
+                floor = data
+            if size <= target_bytes:
+                fit, fit_q = data, q
+                lo = q + 1
+            else:
+                hi = q - 1
+        best, best_q = fit, fit_q
+
+    if best is None:
+        return floor
+    if cache_key is not None:
+        _quality_cache[cache_key] = best_q
     return best
 
-def compress_to_target_fast(im: Image.Image, target_bytes: int, keep_exif: bool) -> bytes:
+def compress_to_target_fast(im: Image.Image, target_bytes: int, exif_bytes: bytes | None,
+                            probe_threads: int = 1) -> bytes:
     # Step 1: resize down to MAX_SIDE immediately
     im_try = downscale_to_max_side(im, MAX_SIDE)
+    pixels = pixel_source(im_try)
 
     # Step 2: binary search quality
-    data = jpeg_under_size(im_try, target_bytes, keep_exif,
-                           subsampling=2, progressive=PROGRESSIVE, optimize=OPTIMIZE)
+    data = jpeg_under_size(pixels, target_bytes, exif_bytes,
+                           subsampling=2, progressive=PROGRESSIVE, optimize=OPTIMIZE,
+                           cache_key=resolution_bucket(im_try.size), probe_threads=probe_threads)
     if data is not None:
         return data
 
     # Step 3: fallback lowest quality
-    exif_bytes = im_try.info.get("exif", None) if keep_exif else None
-    return encode_to_bytes(im_try, 40, 2, PROGRESSIVE, OPTIMIZE, exif_bytes)
+    return encode_to_bytes(pixels, 40, 2, PROGRESSIVE, OPTIMIZE, exif_bytes)
 
 # ---------- Worker ----------
-def convert_heic_file(file_path: Path) -> tuple[bool, str]:
+def _init_worker():
+    """Runs once in each pool process; HEIC support must be registered per interpreter.
+
+    Also limits libvips to one thread per process, and runs a tiny encode so
+    the JPEG encoder's lazy setup happens here rather than on the first file's
+    critical path.
+    """
+    pillow_heif.register_heif_opener()
+    if pyvips is not None:
+        # Each pool process already owns a core; libvips would otherwise
+        # start a thread per core in every one of them.
+        pyvips.concurrency_set(1)
+    tiny = Image.new("RGB", (8, 8))
+    encode_to_bytes(pixel_source(tiny), 75, 2, PROGRESSIVE, OPTIMIZE, None)
+
+def open_heic_vips(file_path: Path, keep_exif: bool) -> tuple[Image.Image, bytes | None]:
+    """Decode, shrink to MAX_SIDE and convert to 8-bit RGB in one libvips pipeline.
+
+    libvips streams the decoded HEIC through the resize and colour conversion
+    without materializing the full-size frame; only the small result lands in
+    memory, so the quality search can encode it repeatedly.
+    """
+    img = pyvips.Image.thumbnail(str(file_path), MAX_SIDE, height=MAX_SIDE, size="down")
+    exif_bytes = img.get("exif-data") if keep_exif and "exif-data" in img.get_fields() else None
+    if exif_bytes:
+        # thumbnail() has already auto-rotated the pixels, but the raw blob
+        # still carries the original orientation tag.
+        exif = Image.Exif()
+        exif.load(exif_bytes)
+        if exif.get(0x0112, 1) != 1:
+            exif[0x0112] = 1
+            exif_bytes = exif.tobytes()
+    if img.interpretation != "srgb":
+        img = img.colourspace("srgb")
+    if img.bands > 3:
+        img = img.extract_band(0, n=3)  # drop alpha, like Image.convert("RGB")
+    img = img.cast("uchar")
+    im = Image.frombuffer("RGB", (img.width, img.height), img.write_to_memory(), "raw", "RGB", 0, 1)
+    return im, exif_bytes
+
+def open_heic(file_path: Path, keep_exif: bool) -> tuple[Image.Image, bytes | None]:
+    """Open a HEIC for conversion; returns the image and, if keep_exif, its EXIF.
+
+    Uses open_heic_vips() instead when pyvips with HEIF support is installed.
+    """
+    global pyvips
+    if pyvips is not None:
+        try:
+            return open_heic_vips(file_path, keep_exif)
+        except pyvips.Error:
+            # e.g. libheif without an HEVC decoder (heifload is still listed);
+            # pillow_heif ships one, so stop trying libvips in this process.
+            pyvips = None
+
+    im = Image.open(file_path)
+    draft_to_max_side(im, MAX_SIDE)
+    return im, (im.info.get("exif", None) if keep_exif else None)
+
+def convert_heic_file(file_path: Path, probe_threads: int = 1) -> tuple[bool, str]:
     try:
         if not file_path.is_file() or file_path.suffix.lower() != ".heic":
             return False, f"Skip: {file_path}"
 
         out_dir = file_path.parent / "Reduced"
         out_dir.mkdir(exist_ok=True)
-        out_path = safe_out_path(out_dir, file_path.stem)
 
-        with Image.open(file_path) as im:
+        im, exif_bytes = open_heic(file_path, KEEP_EXIF)
+        with im:
             target_bytes = int(max(0.1, TARGET_MB) * 1024 * 1024)
-            jpeg_bytes = compress_to_target_fast(im, target_bytes, KEEP_EXIF)
+            jpeg_bytes = compress_to_target_fast(im, target_bytes, exif_bytes, probe_threads)
 
-        out_path.write_bytes(jpeg_bytes)
+        fd, out_path = safe_out_path(out_dir, file_path.stem)
+        try:
+            write_jpeg(fd, jpeg_bytes)
+        except Exception:
+            os.close(fd)
+            out_path.unlink(missing_ok=True)
+            raise
+        os.close(fd)
         size_mb = len(jpeg_bytes) / (1024 * 1024)
         return True, f"Converted: {file_path.name} -> {out_path.relative_to(file_path.parent)} ({size_mb:.2f} MB)"
     except Exception as e:
@@ -154,7 +530,11 @@ def gather_targets(paths):
     return files, dirs, missing
 
 def list_heic_in_dir(d: Path):
-    return [p for p in d.iterdir() if p.is_file() and p.suffix.lower() == ".heic"]
+    # scandir's DirEntry caches the file type from the directory listing, so
+    # this costs no extra stat per entry (and no Path for skipped ones).
+    with os.scandir(d) as it:
+        return [Path(e.path) for e in it
+                if e.name.lower().endswith(".heic") and e.is_file()]
 
 # ---------- Main ----------
 def main():
@@ -186,15 +566,27 @@ def main():
         tprint("Nothing to convert.")
         return
 
-    tprint(f"Converting {total} file(s) with {WORKERS} worker(s)...")
+    # On Windows, ProcessPoolExecutor rejects max_workers > 61 (WaitForMultipleObjects limit)
+    pool_workers = min(WORKERS, 61) if sys.platform == "win32" else WORKERS
+    tprint(f"Converting {total} file(s) with {pool_workers} worker(s)...")
     completed = 0
     render_progress(0, total)
 
     total_ok = 0
-    with ThreadPoolExecutor(max_workers=WORKERS) as ex:
-        futs = {ex.submit(convert_heic_file, f): f for f in file_set}
+    # Workers are never recycled (no max_tasks_per_child), so the warmup is paid once each.
+    with ProcessPoolExecutor(max_workers=pool_workers, initializer=_init_worker) as ex:
+        # With fewer files than workers, the spare workers would sit idle; let
+        # each file spread its quality probes over its share of them instead.
+        # Only very small batches (<= WORKERS // MIN_PROBE_THREADS files) get
+        # enough threads for parallel probing. The tail of a larger batch does
+        # not: its last files start while the other workers are still busy.
+        probe_threads = pool_workers // total if total < pool_workers else 1
+        futs = {ex.submit(convert_heic_file, f, probe_threads): f for f in file_set}
         for fut in as_completed(futs):
-            ok, msg = fut.result()
+            try:
+                ok, msg = fut.result()
+            except Exception as e:  # e.g. BrokenProcessPool when a worker is killed
+                ok, msg = False, f"Failed: {futs[fut]} | {e}"
             tprint("\n" + msg)
             if ok:
                 total_ok += 1